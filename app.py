@@ -5,8 +5,13 @@
 
 from flask import Flask, render_template, request, jsonify, send_file
 from generator import StringGenerator
-from storage import StringStorage
+from storage import StringStorage, ExpiryPurger, UNSET
+from sharded_storage import ShardedStringStorage
+from verifier import TokenVerifier
+from uniqueness import UniquenessGuard
+from serializers import FastJSONProvider, MSGPACK_MIMETYPE, dumps, dumps_msgpack, render, wants_msgpack
 from dotenv import load_dotenv
+from datetime import datetime, timedelta
 import io
 import os
 
@@ -14,16 +19,102 @@ import os
 load_dotenv()
 
 app = Flask(__name__)
-app.json.ensure_ascii = False  # 支持中文 JSON
+app.json = FastJSONProvider(app)  # 快速 JSON 编码（支持中文）
 
 # 从环境变量读取配置
 DEFAULT_PREFIX = os.getenv('STRING_PREFIX', 'custom-')
 SERVER_HOST = os.getenv('SERVER_HOST', '127.0.0.1')
 SERVER_PORT = int(os.getenv('SERVER_PORT', '5000'))
+STORAGE_SHARDS = int(os.getenv('STORAGE_SHARDS', '0'))
+STORAGE_SHARD_DIR = os.getenv('STORAGE_SHARD_DIR', 'data/shards')
+VERIFY_CACHE_SIZE = int(os.getenv('VERIFY_CACHE_SIZE', '0'))
+VERIFY_CACHE_TTL = float(os.getenv('VERIFY_CACHE_TTL', '5'))
+VERIFY_BATCH_LIMIT = 1000
+UNIQUENESS_GUARD = os.getenv('UNIQUENESS_GUARD', 'false').lower() == 'true'
+UNIQUENESS_GUARD_DIR = os.getenv('UNIQUENESS_GUARD_DIR', 'data/bloom')
+UNIQUENESS_GUARD_CAPACITY = int(os.getenv('UNIQUENESS_GUARD_CAPACITY', '1000000'))
+UNIQUENESS_GUARD_ERROR_RATE = float(os.getenv('UNIQUENESS_GUARD_ERROR_RATE', '0.001'))
+EXPIRY_PURGE_INTERVAL = float(os.getenv('EXPIRY_PURGE_INTERVAL', '60'))
+EXPIRY_PURGE_BATCH = int(os.getenv('EXPIRY_PURGE_BATCH', '500'))
+MAX_TTL = 100 * 365 * 24 * 3600  # 有效期上限：100 年
 
 # 初始化生成器和存储
-generator = StringGenerator(prefix=DEFAULT_PREFIX)
-storage = StringStorage()
+if STORAGE_SHARDS > 0:
+    storage = ShardedStringStorage(STORAGE_SHARD_DIR, STORAGE_SHARDS)
+else:
+    storage = StringStorage()
+verifier = TokenVerifier(storage, cache_size=VERIFY_CACHE_SIZE, cache_ttl=VERIFY_CACHE_TTL)
+
+# 后台分批清理过期记录（间隔为 0 时不启用）
+if EXPIRY_PURGE_INTERVAL > 0:
+    ExpiryPurger(storage, interval=EXPIRY_PURGE_INTERVAL, batch_size=EXPIRY_PURGE_BATCH).start()
+
+# 唯一性保护（可选）：过滤器新建时载入已保存的值，命中时到存储中精确确认
+guard = None
+if UNIQUENESS_GUARD:
+    guard = UniquenessGuard(
+        UNIQUENESS_GUARD_DIR,
+        capacity=UNIQUENESS_GUARD_CAPACITY,
+        error_rate=UNIQUENESS_GUARD_ERROR_RATE,
+        exists=storage.value_exists,
+        source=storage.iter_values
+    )
+generator = StringGenerator(prefix=DEFAULT_PREFIX, guard=guard)
+
+
+def record_guarded(format_type, length, value):
+    """把已写入存储的值记入唯一性保护（失败不影响已提交的保存）"""
+    if guard is None:
+        return
+    try:
+        guard.add(format_type, length, value)
+    except Exception:
+        app.logger.warning('唯一性保护记录失败: %s', format_type, exc_info=True)
+
+
+def parse_expires_at(data):
+    """
+    从请求体解析过期时间
+
+    支持 "expires_at"（ISO 8601 时间，null 表示永不过期）或 "ttl"（秒）。
+
+    Returns:
+        本地时间 ISO 字符串、None（永不过期）或 UNSET（未提供）
+
+    Raises:
+        ValueError: 格式错误或时间已过
+    """
+    if 'ttl' in data:
+        ttl = data.get('ttl')
+        if not isinstance(ttl, int) or isinstance(ttl, bool) or ttl < 1:
+            raise ValueError('ttl 必须是正整数（秒）')
+        if ttl > MAX_TTL:
+            raise ValueError(f'ttl 不能超过 {MAX_TTL} 秒')
+        return (datetime.now() + timedelta(seconds=ttl)).isoformat()
+
+    if 'expires_at' not in data:
+        return UNSET
+
+    raw = data.get('expires_at')
+    if raw is None:
+        return None
+
+    try:
+        expires = datetime.fromisoformat(str(raw).strip())
+    except ValueError:
+        raise ValueError('过期时间格式错误，请使用 ISO 8601 格式')
+
+    # 带时区的时间统一转换为本地时间，与 created_at 保持一致
+    if expires.tzinfo is not None:
+        try:
+            expires = expires.astimezone().replace(tzinfo=None)
+        except (OverflowError, ValueError):
+            raise ValueError('过期时间超出有效范围')
+
+    if expires <= datetime.now():
+        raise ValueError('过期时间必须晚于当前时间')
+
+    return expires.isoformat()
 
 
 # ==================== Web 页面 ====================
@@ -207,6 +298,22 @@ def generate_string():
         return jsonify({'error': f'生成失败: {str(e)}'}), 500
 
 
+@app.route('/api/uniqueness', methods=['GET'])
+def get_uniqueness_report():
+    """获取唯一性保护的过滤器统计与碰撞概率（按格式/长度）"""
+    try:
+        if guard is None:
+            return jsonify({'enabled': False, 'filters': []})
+
+        return jsonify({
+            'enabled': True,
+            'filters': guard.report()
+        })
+
+    except Exception as e:
+        return jsonify({'error': f'查询失败: {str(e)}'}), 500
+
+
 @app.route('/api/entries', methods=['GET'])
 def get_entries():
     """
@@ -214,12 +321,14 @@ def get_entries():
 
     查询参数:
     - search: 搜索关键词（可选）
+
+    支持 Accept: application/msgpack 返回 MessagePack
     """
     try:
         search = request.args.get('search', '').strip()
         entries = storage.get_all(search if search else None)
 
-        return jsonify({
+        return render({
             'entries': entries,
             'total': len(entries)
         })
@@ -238,7 +347,9 @@ def save_entry():
         "name": "my_key",           // 自定义名称（必填）
         "value": "custom-abc123",   // 字符串值（必填）
         "format": "hex",            // 格式类型（必填）
-        "length": 32                // 长度（可选）
+        "length": 32,               // 长度（可选）
+        "expires_at": "2030-01-01T00:00:00",  // 过期时间（可选）
+        "ttl": 3600                 // 有效期秒数（可选，与 expires_at 二选一）
     }
     """
     try:
@@ -250,6 +361,7 @@ def save_entry():
         value = (data.get('value') or '').strip()
         format_type = (data.get('format') or '').strip()
         length = data.get('length')
+        expires_at = parse_expires_at(data)
 
         # 验证必填字段
         if not name:
@@ -272,9 +384,16 @@ def save_entry():
         # 对于不支持长度的格式，忽略长度参数
         if not format_info['supports_length']:
             length = None
+        elif length is not None:
+            if not isinstance(length, int) or isinstance(length, bool) or length < 1 or length > 256:
+                return jsonify({'error': '长度必须在 1-256 之间'}), 400
 
         # 保存到数据库
-        entry = storage.save(name, value, format_type, length)
+        entry = storage.save(name, value, format_type, length,
+                             expires_at=None if expires_at is UNSET else expires_at)
+
+        # 手动保存的值同样记入唯一性保护；记录已提交，保护失败只记日志
+        record_guarded(format_type, length, value)
 
         return jsonify({
             'message': '保存成功',
@@ -310,7 +429,9 @@ def update_entry(entry_id):
     请求体:
     {
         "name": "new_name",    // 新名称（可选）
-        "value": "new_value"   // 新值（可选）
+        "value": "new_value",  // 新值（可选）
+        "expires_at": null,    // 新过期时间（可选，null 表示永不过期）
+        "ttl": 3600            // 从现在起的有效期秒数（可选）
     }
     """
     try:
@@ -320,23 +441,33 @@ def update_entry(entry_id):
 
         name = (data.get('name') or '').strip() if 'name' in data else None
         value = (data.get('value') or '').strip() if 'value' in data else None
+        expires_at = parse_expires_at(data)
 
         # 至少要更新一个字段
-        if name is None and value is None:
+        if name is None and value is None and expires_at is UNSET:
             return jsonify({'error': '至少需要提供一个更新字段'}), 400
 
         # 如果更新值，强制确保前缀存在
         if value is not None and not value.startswith(generator.prefix):
             value = generator.prefix + value
 
+        invalidates = value is not None or expires_at is not UNSET
+        previous = storage.get_by_id(entry_id) if invalidates else None
+
         # 更新记录
-        success = storage.update(entry_id, name, value)
+        success = storage.update(entry_id, name, value, expires_at)
 
         if not success:
             return jsonify({'error': '记录不存在'}), 404
 
+        if previous:
+            verifier.invalidate(previous['value'])
+
         # 返回更新后的记录
         entry = storage.get_by_id(entry_id)
+
+        if value is not None and entry:
+            record_guarded(entry['format'], entry['length'], entry['value'])
         return jsonify({
             'message': '更新成功',
             'entry': entry
@@ -352,33 +483,91 @@ def update_entry(entry_id):
 def delete_entry(entry_id):
     """删除记录"""
     try:
+        previous = storage.get_by_id(entry_id)
         success = storage.delete(entry_id)
 
         if not success:
             return jsonify({'error': '记录不存在'}), 404
 
+        verifier.invalidate(previous['value'])
+
         return jsonify({'message': '删除成功'})
 
     except Exception as e:
         return jsonify({'error': f'删除失败: {str(e)}'}), 500
 
 
+@app.route('/api/verify', methods=['POST'])
+def verify_tokens():
+    """
+    校验令牌是否为已保存的值（按摘要精确匹配，不返回任何记录信息）
+
+    请求体（二选一）:
+    {
+        "value": "custom-abc123"            // 单个令牌
+    }
+    {
+        "values": ["custom-a", "custom-b"]  // 批量，最多 1000 个
+    }
+
+    批量校验支持 Accept: application/msgpack 返回 MessagePack
+    """
+    try:
+        data = request.get_json(silent=True)
+        if data is None:
+            return jsonify({'error': '请求体格式错误'}), 400
+
+        if 'values' in data:
+            values = data.get('values')
+            if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+                return jsonify({'error': 'values 必须是字符串数组'}), 400
+            if len(values) > VERIFY_BATCH_LIMIT:
+                return jsonify({'error': f'单次最多校验 {VERIFY_BATCH_LIMIT} 个令牌'}), 400
+
+            results = verifier.verify_many(values)
+            return render({
+                'results': results,
+                'valid_count': sum(results),
+                'total': len(results)
+            })
+
+        value = data.get('value')
+        if not isinstance(value, str) or not value:
+            return jsonify({'error': '令牌不能为空'}), 400
+
+        return jsonify({'valid': verifier.verify(value)})
+
+    except Exception as e:
+        return jsonify({'error': f'校验失败: {str(e)}'}), 500
+
+
 @app.route('/api/export', methods=['GET'])
 def export_entries():
-    """导出所有记录为 JSON 文件"""
+    """导出所有记录为 JSON 文件（Accept: application/msgpack 时导出 MessagePack）"""
     try:
-        json_data = storage.export_json()
+        records = storage.get_all()
+
+        if wants_msgpack():
+            data = dumps_msgpack(records)
+            mimetype = MSGPACK_MIMETYPE
+            download_name = 'strings-export.msgpack'
+        else:
+            data = dumps(records, indent=True)
+            mimetype = 'application/json'
+            download_name = 'strings-export.json'
 
         # 创建文件流
-        buffer = io.BytesIO(json_data.encode('utf-8'))
+        buffer = io.BytesIO(data)
         buffer.seek(0)
 
-        return send_file(
+        response = send_file(
             buffer,
-            mimetype='application/json',
+            mimetype=mimetype,
             as_attachment=True,
-            download_name='strings-export.json'
+            download_name=download_name
         )
+        response.vary.add('Accept')
+        return response
 
     except Exception as e:
         return jsonify({'error': f'导出失败: {str(e)}'}), 500
@@ -414,6 +603,10 @@ if __name__ == '__main__':
     print("🚀 字符串生成器启动中...")
     print(f"📍 访问地址: http://{SERVER_HOST}:{SERVER_PORT}")
     print(f"🔧 字符串前缀: {DEFAULT_PREFIX}")
+    if guard is not None:
+        print(f"🛡️ 唯一性保护: {UNIQUENESS_GUARD_DIR}")
+    if STORAGE_SHARDS > 0:
+        print(f"🗂️ 分片存储: {STORAGE_SHARD_DIR} ({STORAGE_SHARDS} 分片)")
     print("=" * 50)
 
     # 通过环境变量控制 debug 模式
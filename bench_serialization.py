@@ -0,0 +1,83 @@
+"""
+序列化性能基准
+对比标准库 json 与快速编码器 / MessagePack 在 /api/entries 与导出响应上的 CPU 开销
+
+用法:
+    python bench_serialization.py [记录数] [重复次数]
+"""
+
+import json
+import sys
+import time
+
+import serializers
+from generator import StringGenerator
+
+
+def build_entries(count):
+    """构造与 /api/entries 响应结构一致的测试数据"""
+    gen = StringGenerator()
+    formats = ["uuid", "uuid_hex", "hex", "base64url", "alnum", "jwt"]
+    entries = []
+    for i in range(count):
+        format_type = formats[i % len(formats)]
+        entries.append({
+            "id": i + 1,
+            "name": f"测试键_{i}",
+            "value": gen.generate(format_type, 32),
+            "format": format_type,
+            "length": 32,
+            "created_at": "2024-01-01T12:00:00.000000",
+            "updated_at": "2024-01-01T12:00:00.000000"
+        })
+    return {"entries": entries, "total": count}
+
+
+def measure(func, repeat):
+    """返回单次调用的平均 CPU 时间（毫秒）和输出大小（字节）"""
+    output = func()
+    start = time.process_time()
+    for _ in range(repeat):
+        func()
+    elapsed = time.process_time() - start
+    return elapsed / repeat * 1000, len(output)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    payload = build_entries(count)
+    records = payload["entries"]
+
+    cases = [
+        # 与 Flask 默认 jsonify（非调试模式）等价：ensure_ascii=False，按键排序，紧凑分隔符
+        ("列表 stdlib json", lambda: json.dumps(
+            payload, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+        ).encode("utf-8")),
+        (f"列表 {serializers.JSON_BACKEND}", lambda: serializers.dumps(payload, sort_keys=True)),
+        ("导出 stdlib json", lambda: json.dumps(records, ensure_ascii=False, indent=2).encode("utf-8")),
+        (f"导出 {serializers.JSON_BACKEND}", lambda: serializers.dumps(records, indent=True)),
+    ]
+    if serializers.msgpack is not None:
+        cases.append(("列表 msgpack", lambda: serializers.dumps_msgpack(payload)))
+        cases.append(("导出 msgpack", lambda: serializers.dumps_msgpack(records)))
+
+    print(f"=== 序列化基准（{count} 条记录，重复 {repeat} 次，JSON 后端: {serializers.JSON_BACKEND}）===\n")
+
+    results = {}
+    for label, func in cases:
+        cpu_ms, size = measure(func, repeat)
+        results[label] = cpu_ms
+        print(f"{label:24} {cpu_ms:10.2f} ms/请求 {size / 1024:10.1f} KiB")
+
+    print()
+    for kind in ["列表", "导出"]:
+        baseline = results[f"{kind} stdlib json"]
+        for label, cpu_ms in results.items():
+            if label.startswith(kind) and "stdlib" not in label:
+                print(f"{label:24} 每请求节省 {baseline - cpu_ms:8.2f} ms CPU（{baseline / cpu_ms:.1f}x）")
+
+
+if __name__ == "__main__":
+    main()
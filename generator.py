@@ -4,15 +4,90 @@
 """
 
 import uuid
+import math
+import hmac
+import hashlib
+import itertools
 import secrets
 import base64
 
 
+class _SystemRandom:
+    """生产模式随机源：操作系统 CSPRNG（secrets / uuid4）"""
+
+    @staticmethod
+    def token_bytes(num_bytes):
+        return secrets.token_bytes(num_bytes)
+
+    @staticmethod
+    def choice(sequence):
+        return secrets.choice(sequence)
+
+    @staticmethod
+    def uuid4():
+        return uuid.uuid4()
+
+
+class _CounterStream:
+    """
+    种子模式随机源：HMAC-SHA256 计数器模式
+
+    第 index 个字符串的字节流为 HMAC(key, index || block) 依次拼接，
+    任意序号可以独立计算，与生成顺序和进程无关。
+    key 由种子按格式、长度和前缀派生（见 StringGenerator._stream_key），不同格式的字节流互不相关。
+    """
+
+    def __init__(self, key, index):
+        self._key = key
+        self._index = index.to_bytes(8, "big")
+        self._blocks = itertools.count()
+        self._buffer = b""
+
+    def token_bytes(self, num_bytes):
+        while len(self._buffer) < num_bytes:
+            block = next(self._blocks).to_bytes(8, "big")
+            self._buffer += hmac.new(self._key, self._index + block, hashlib.sha256).digest()
+        result, self._buffer = self._buffer[:num_bytes], self._buffer[num_bytes:]
+        return result
+
+    def choice(self, sequence):
+        # 拒绝采样，避免取模带来的偏差
+        limit = 256 - 256 % len(sequence)
+        while True:
+            byte = self.token_bytes(1)[0]
+            if byte < limit:
+                return sequence[byte % len(sequence)]
+
+    def uuid4(self):
+        return uuid.UUID(bytes=self.token_bytes(16), version=4)
+
+
+_SYSTEM_RANDOM = _SystemRandom()
+
+
 class StringGenerator:
     """随机字符串生成器"""
 
-    def __init__(self, prefix="custom-"):
+    # 启用唯一性保护时，连续确认重复的最大重试次数
+    MAX_UNIQUE_ATTEMPTS = 10
+
+    def __init__(self, prefix="custom-", guard=None, seed=None):
+        """
+        Args:
+            prefix: 字符串前缀
+            guard: 可选的唯一性保护（uniqueness.UniquenessGuard）
+            seed: 种子（str 或 bytes）。仅用于压测和测试数据，
+                  设置后输出完全可复现，不具备安全性，切勿用于生产
+        """
         self.prefix = prefix
+        self.guard = guard
+        self._seed_key = seed.encode("utf-8") if isinstance(seed, str) else seed
+        self._next_index = itertools.count()
+
+    @property
+    def seeded(self):
+        """是否处于种子（可复现）模式"""
+        return self._seed_key is not None
 
     def generate(self, format_type="uuid_hex", length=32):
         """
@@ -24,77 +99,167 @@ class StringGenerator:
 
         Returns:
             生成的字符串
+
+        Raises:
+            ValueError: 不支持的格式类型
+            RuntimeError: 启用唯一性保护时多次重试仍然重复
+
+        种子模式下依次生成第 0、1、2… 个字符串，且不经过唯一性保护，
+        以保证输出序列可复现。
+        """
+        if self.seeded:
+            return self.generate_at(next(self._next_index), format_type, length)
+
+        if self.guard is None:
+            return self._generate_once(format_type, length)
+
+        format_info = self.get_supported_formats().get(format_type)
+        guard_length = length if format_info and format_info["supports_length"] else None
+
+        for _ in range(self.MAX_UNIQUE_ATTEMPTS):
+            value = self._generate_once(format_type, length)
+            if self.guard.check_and_add(format_type, guard_length, value):
+                return value
+
+        raise RuntimeError(f"连续 {self.MAX_UNIQUE_ATTEMPTS} 次生成重复值，请增加长度")
+
+    def generate_at(self, index, format_type="uuid_hex", length=32):
         """
+        种子模式下直接计算第 index 个字符串
+
+        Args:
+            index: 序号（从 0 开始）
+            format_type: 格式类型
+            length: 主体部分长度（不包含前缀）
+
+        Returns:
+            生成的字符串，相同种子/前缀/格式/长度下结果固定
+
+        Raises:
+            ValueError: 未设置种子或序号无效
+        """
+        if not self.seeded:
+            raise ValueError("按序号生成仅支持种子模式")
+        if not isinstance(index, int) or index < 0 or index >= 2 ** 64:
+            raise ValueError("序号必须在 0 到 2^64-1 之间")
+
+        stream = _CounterStream(self._stream_key(format_type, length), index)
+        return self._generate_once(format_type, length, stream)
+
+    def _stream_key(self, format_type, length):
+        """派生某个格式/长度/前缀的字节流密钥：HMAC(seed, format|length|prefix)"""
+        format_info = self.get_supported_formats().get(format_type)
+        if not format_info or not format_info["supports_length"]:
+            length = ""
+        label = f"{format_type}|{length}|{self.prefix}".encode("utf-8")
+        return hmac.new(self._seed_key, label, hashlib.sha256).digest()
+
+    def generate_range(self, start, stop, format_type="uuid_hex", length=32):
+        """
+        种子模式下生成 [start, stop) 区间的字符串
+
+        多个进程各自处理互不重叠的区间，合并结果与单进程顺序生成完全一致。
+        """
+        for index in range(start, stop):
+            yield self.generate_at(index, format_type, length)
+
+    def _generate_once(self, format_type, length, rng=_SYSTEM_RANDOM):
+        """按格式生成一次，不做唯一性检查"""
         if format_type == "uuid":
-            return self._generate_uuid()
+            return self._generate_uuid(rng)
         elif format_type == "uuid_hex":
-            return self._generate_uuid_hex()
+            return self._generate_uuid_hex(rng)
         elif format_type == "hex":
-            return self._generate_hex(length)
+            return self._generate_hex(length, rng)
         elif format_type == "base64url":
-            return self._generate_base64url(length)
+            return self._generate_base64url(length, rng)
         elif format_type == "alnum":
-            return self._generate_alnum(length)
+            return self._generate_alnum(length, rng)
         elif format_type == "jwt":
-            return self._generate_jwt_like(length)
+            return self._generate_jwt_like(length, rng)
         else:
             raise ValueError(f"不支持的格式类型: {format_type}")
 
-    def _generate_uuid(self):
+    def _generate_uuid(self, rng=_SYSTEM_RANDOM):
         """生成标准 UUID 格式（带连字符）"""
-        return f"{self.prefix}{uuid.uuid4()}"
+        return f"{self.prefix}{rng.uuid4()}"
 
-    def _generate_uuid_hex(self):
+    def _generate_uuid_hex(self, rng=_SYSTEM_RANDOM):
         """生成 UUID 十六进制格式（32位，无连字符）"""
-        return f"{self.prefix}{uuid.uuid4().hex}"
+        return f"{self.prefix}{rng.uuid4().hex}"
 
-    def _generate_hex(self, length):
+    def _generate_hex(self, length, rng=_SYSTEM_RANDOM):
         """生成纯十六进制字符串"""
         # 每个字节生成2个十六进制字符
         num_bytes = (length + 1) // 2
-        random_bytes = secrets.token_bytes(num_bytes)
+        random_bytes = rng.token_bytes(num_bytes)
         hex_string = random_bytes.hex()[:length]
         return f"{self.prefix}{hex_string}"
 
-    def _generate_base64url(self, length):
+    def _generate_base64url(self, length, rng=_SYSTEM_RANDOM):
         """生成 URL 安全的 base64 字符串"""
         # base64 编码后每3字节变成4字符，所以需要 length * 3 / 4 字节
         num_bytes = (length * 3 + 3) // 4
-        random_bytes = secrets.token_bytes(num_bytes)
+        random_bytes = rng.token_bytes(num_bytes)
         # 使用 URL 安全的 base64 编码（替换 +/ 为 -_，去除 padding）
         b64_string = base64.urlsafe_b64encode(random_bytes).decode('ascii').rstrip('=')
         return f"{self.prefix}{b64_string[:length]}"
 
-    def _generate_alnum(self, length):
+    def _generate_alnum(self, length, rng=_SYSTEM_RANDOM):
         """生成字母+数字混合字符串"""
-        # 使用 secrets.choice 从字母数字字符集中随机选择
+        # 从字母数字字符集中随机选择（生产模式为 secrets.choice）
         import string
         alphabet = string.ascii_letters + string.digits
-        random_string = ''.join(secrets.choice(alphabet) for _ in range(length))
+        random_string = ''.join(rng.choice(alphabet) for _ in range(length))
         return f"{self.prefix}{random_string}"
 
-    def _generate_jwt_like(self, payload_length=32):
+    def _generate_jwt_like(self, payload_length=32, rng=_SYSTEM_RANDOM):
         """
         生成 JWT 风格的三段式字符串
         格式: prefix-header.payload.signature
 
         Args:
             payload_length: 中间段（payload）的长度
+            rng: 随机源
         """
         # JWT 的 header 通常较短（约20-30字符）
-        header_bytes = secrets.token_bytes(12)
+        header_bytes = rng.token_bytes(12)
         header = base64.urlsafe_b64encode(header_bytes).decode('ascii').rstrip('=')
 
         # payload 部分使用指定长度
-        payload_bytes = secrets.token_bytes((payload_length * 3 + 3) // 4)
+        payload_bytes = rng.token_bytes((payload_length * 3 + 3) // 4)
         payload = base64.urlsafe_b64encode(payload_bytes).decode('ascii').rstrip('=')[:payload_length]
 
         # signature 部分固定长度（约40-50字符）
-        signature_bytes = secrets.token_bytes(32)
+        signature_bytes = rng.token_bytes(32)
         signature = base64.urlsafe_b64encode(signature_bytes).decode('ascii').rstrip('=')
 
         return f"{self.prefix}{header}.{payload}.{signature}"
 
+    @staticmethod
+    def entropy_bits(format_type, length=32):
+        """
+        估算随机部分的熵（比特），用于碰撞概率计算
+
+        Args:
+            format_type: 格式类型
+            length: 主体部分长度
+        """
+        if format_type in ("uuid", "uuid_hex"):
+            # UUID v4 中有 6 位固定为版本号和变体
+            return 122
+        elif format_type == "hex":
+            return 4 * length
+        elif format_type == "base64url":
+            return 6 * length
+        elif format_type == "alnum":
+            return length * math.log2(62)
+        elif format_type == "jwt":
+            # header 12 字节 + payload + signature 32 字节
+            return 96 + 6 * length + 256
+        else:
+            raise ValueError(f"不支持的格式类型: {format_type}")
+
     @staticmethod
     def get_supported_formats():
         """获取支持的所有格式"""
@@ -140,6 +305,25 @@ class StringGenerator:
 
 
 if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="字符串生成器（不带 --seed 时运行测试代码）")
+    parser.add_argument("--seed", help="种子模式：输出可复现，仅用于压测与测试数据")
+    parser.add_argument("--format", default="uuid_hex", help="格式类型")
+    parser.add_argument("--length", type=int, default=32, help="主体部分长度")
+    parser.add_argument("--prefix", default="custom-", help="字符串前缀")
+    parser.add_argument("--start", type=int, default=0, help="起始序号（多进程时各进程取不重叠区间）")
+    parser.add_argument("--count", type=int, default=10, help="生成数量")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        gen = StringGenerator(prefix=args.prefix, seed=args.seed)
+        out = sys.stdout
+        for value in gen.generate_range(args.start, args.start + args.count, args.format, args.length):
+            out.write(value + "\n")
+        sys.exit(0)
+
     # 测试代码
     gen = StringGenerator()
 
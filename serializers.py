@@ -0,0 +1,119 @@
+"""
+序列化模块
+优先使用 orjson / ujson 等快速 JSON 编码器，未安装时回退到标准库 json；
+并支持 MessagePack 内容协商
+"""
+
+import json
+
+from flask import request, current_app
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+MSGPACK_MIMETYPE = "application/msgpack"
+
+if orjson is not None:
+    JSON_BACKEND = "orjson"
+elif ujson is not None:
+    JSON_BACKEND = "ujson"
+else:
+    JSON_BACKEND = "json"
+
+
+def dumps(obj, indent: bool = False, sort_keys: bool = False) -> bytes:
+    """
+    使用当前最快的可用编码器序列化为 UTF-8 JSON 字节
+
+    Args:
+        obj: 待序列化对象
+        indent: 是否缩进两格（用于导出文件）
+        sort_keys: 是否按键排序
+
+    Returns:
+        JSON 字节串（不转义非 ASCII 字符）
+    """
+    if JSON_BACKEND == "orjson":
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, option=option, default=DefaultJSONProvider.default)
+
+    if JSON_BACKEND == "ujson":
+        return ujson.dumps(
+            obj, ensure_ascii=False, indent=2 if indent else 0, sort_keys=sort_keys
+        ).encode("utf-8")
+
+    return json.dumps(
+        obj, ensure_ascii=False, indent=2 if indent else None, sort_keys=sort_keys,
+        default=DefaultJSONProvider.default
+    ).encode("utf-8")
+
+
+def dumps_msgpack(obj) -> bytes:
+    """序列化为 MessagePack 字节串"""
+    if msgpack is None:
+        raise RuntimeError("未安装 msgpack")
+    return msgpack.packb(obj, use_bin_type=True, default=DefaultJSONProvider.default)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON 提供器：jsonify 与 app.json 均走快速编码器"""
+
+    ensure_ascii = False
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs:
+            # 带自定义参数的调用交给标准库处理，保持行为一致
+            return super().dumps(obj, **kwargs)
+        return dumps(obj, sort_keys=self.sort_keys).decode("utf-8")
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            dumps(obj, sort_keys=self.sort_keys), mimetype=self.mimetype
+        )
+
+
+def wants_msgpack() -> bool:
+    """当前请求是否协商为 MessagePack（未安装 msgpack 时始终为 False）"""
+    if msgpack is None:
+        return False
+    best = request.accept_mimetypes.best_match(["application/json", MSGPACK_MIMETYPE])
+    return best == MSGPACK_MIMETYPE
+
+
+def render(payload, status: int = 200):
+    """
+    按 Accept 头返回 JSON 或 MessagePack 响应
+
+    Args:
+        payload: 响应数据
+        status: HTTP 状态码
+
+    Returns:
+        Flask 响应对象
+    """
+    if wants_msgpack():
+        response = current_app.response_class(dumps_msgpack(payload), mimetype=MSGPACK_MIMETYPE)
+    else:
+        response = current_app.json.response(payload)
+    response.status_code = status
+    response.vary.add("Accept")
+    return response
@@ -0,0 +1,516 @@
+"""
+分片存储模块
+按名称哈希将记录分散到多个 SQLite 文件，突破单文件单写锁的写入瓶颈
+"""
+
+import argparse
+import heapq
+import json
+import shutil
+import sqlite3
+import zlib
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Optional, Iterable, Iterator, Tuple
+
+from storage import StringStorage, COLUMNS, NOT_EXPIRED, UNSET, digest_value, latest_expiry
+
+
+class ShardedStringStorage:
+    """
+    分片字符串存储管理器
+
+    与 StringStorage 接口一致，可直接替换。
+    - 单键操作（save / get_by_name）按名称哈希路由到唯一分片
+    - get_all、搜索与统计并发扫描所有分片，按 created_at 归并排序
+
+    记录 ID 全局唯一：分片 i 分配的 ID 满足 id % shard_count == i（归属分片）。
+    重命名迁移或从其他布局重新分片后，记录可能不在归属分片中，此时在归属分片的
+    id_locations 表中登记实际所在分片，按 ID 查询最多访问两个分片。
+    """
+
+    def __init__(self, db_dir="data/shards", shard_count=4):
+        if shard_count < 1:
+            raise ValueError("分片数量必须大于 0")
+
+        existing = len(list(Path(db_dir).glob("strings-*.db")))
+        if existing and existing != shard_count:
+            raise ValueError(
+                f"目录 {db_dir} 中已有 {existing} 个分片，与当前配置 {shard_count} 不一致，请先执行重新分片"
+            )
+
+        self.db_dir = db_dir
+        self.shard_count = shard_count
+        self.shards = [
+            StringStorage(self._shard_path(db_dir, index))
+            for index in range(shard_count)
+        ]
+        for index, shard in enumerate(self.shards):
+            self._init_shard(shard, index)
+
+        self._executor = ThreadPoolExecutor(max_workers=shard_count)
+
+    @staticmethod
+    def _shard_path(db_dir, index):
+        """分片数据库文件路径"""
+        return str(Path(db_dir) / f"strings-{index:03d}.db")
+
+    @staticmethod
+    def _connect(db_path):
+        """打开分片连接（手动管理事务）"""
+        return sqlite3.connect(db_path, isolation_level=None)
+
+    def _init_shard(self, shard: StringStorage, index: int):
+        """初始化分片元数据，并校验分片数量是否与磁盘一致"""
+        conn = self._connect(shard.db_path)
+        try:
+            # WAL 模式下读写互不阻塞，各分片独立加锁
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS shard_meta (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            """)
+            # 归属本分片、但实际存放在其他分片的记录 ID
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS id_locations (
+                    id INTEGER PRIMARY KEY,
+                    shard INTEGER NOT NULL
+                )
+            """)
+            conn.execute("BEGIN IMMEDIATE")
+            meta = dict(conn.execute("SELECT key, value FROM shard_meta").fetchall())
+
+            if not meta:
+                conn.executemany(
+                    "INSERT INTO shard_meta (key, value) VALUES (?, ?)",
+                    [("shard_count", self.shard_count), ("shard_index", index), ("next_seq", 0)]
+                )
+            elif meta["shard_count"] != self.shard_count or meta["shard_index"] != index:
+                conn.execute("ROLLBACK")
+                raise ValueError(
+                    f"分片 {shard.db_path} 属于 {meta['shard_count']} 分片布局，"
+                    f"与当前配置 {self.shard_count} 不一致，请先执行重新分片"
+                )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def _shard_index(self, name: str) -> int:
+        """根据名称计算分片编号（跨进程稳定的哈希）"""
+        return zlib.crc32(name.encode("utf-8")) % self.shard_count
+
+    def _allocate_id(self, conn, index: int) -> int:
+        """在当前事务内为分片分配下一个全局 ID"""
+        seq = conn.execute("SELECT value FROM shard_meta WHERE key = 'next_seq'").fetchone()[0]
+        conn.execute("UPDATE shard_meta SET value = ? WHERE key = 'next_seq'", (seq + 1,))
+        return seq * self.shard_count + index
+
+    def _scatter(self, func):
+        """在所有分片上并发执行 func(shard)，按分片顺序返回结果"""
+        return list(self._executor.map(func, self.shards))
+
+    def _insert(self, index: int, record: Dict, allocate: bool) -> Dict:
+        """向指定分片插入记录，allocate 为真时分配新 ID"""
+        conn = self._connect(self.shards[index].db_path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if allocate:
+                record = dict(record, id=self._allocate_id(conn, index))
+            # 同名记录已过期但尚未清理时，直接让出名称
+            conn.execute(
+                "DELETE FROM strings WHERE name = ? AND expires_at <= ?",
+                (record["name"], record["updated_at"])
+            )
+            conn.execute("""
+                INSERT INTO strings (id, name, value, format, length, created_at, updated_at, value_digest, expires_at)
+                VALUES (:id, :name, :value, :format, :length, :created_at, :updated_at, :value_digest, :expires_at)
+            """, dict(record, value_digest=digest_value(record["value"])))
+            conn.execute("COMMIT")
+            return record
+        except sqlite3.IntegrityError:
+            conn.execute("ROLLBACK")
+            raise ValueError(f"名称 '{record['name']}' 已存在")
+        finally:
+            conn.close()
+
+    def _record_location(self, string_id: int, index: int):
+        """在归属分片中登记 ID 的实际所在分片（回到归属分片时移除登记）"""
+        home = string_id % self.shard_count
+        with closing(sqlite3.connect(self.shards[home].db_path)) as conn, conn:
+            if index == home:
+                conn.execute("DELETE FROM id_locations WHERE id = ?", (string_id,))
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO id_locations (id, shard) VALUES (?, ?)",
+                    (string_id, index)
+                )
+
+    def _lookup_location(self, string_id: int) -> Optional[int]:
+        """查询归属分片中登记的实际所在分片"""
+        home = string_id % self.shard_count
+        with closing(sqlite3.connect(self.shards[home].db_path)) as conn:
+            row = conn.execute("SELECT shard FROM id_locations WHERE id = ?", (string_id,)).fetchone()
+            return row[0] if row else None
+
+    def _locate(self, string_id: int):
+        """查找 ID 所在分片，返回 (分片编号, 记录)"""
+        home = string_id % self.shard_count
+        row = self.shards[home].get_by_id(string_id)
+        if row:
+            return home, row
+
+        index = self._lookup_location(string_id)
+        if index is not None:
+            row = self.shards[index].get_by_id(string_id)
+            return (index, row) if row else (None, None)
+
+        # 未登记时（如登记功能上线前迁移的记录）并发扫描其余分片，找到后补登记
+        rows = self._scatter(lambda shard: shard.get_by_id(string_id))
+        for index, row in enumerate(rows):
+            if row:
+                self._record_location(string_id, index)
+                return index, row
+        return None, None
+
+    def save(self, name: str, value: str, format_type: str, length: Optional[int] = None,
+             expires_at: Optional[str] = None) -> Dict:
+        """保存字符串（路由到名称所在分片）"""
+        now = StringStorage.now()
+        record = {
+            "id": None,
+            "name": name,
+            "value": value,
+            "format": format_type,
+            "length": length,
+            "created_at": now,
+            "updated_at": now,
+            "expires_at": expires_at
+        }
+        return self._insert(self._shard_index(name), record, allocate=True)
+
+    def get_all(self, search: Optional[str] = None) -> List[Dict]:
+        """获取所有记录（各分片结果按 created_at 倒序归并）"""
+        results = self._scatter(lambda shard: shard.get_all(search))
+        return list(heapq.merge(*results, key=lambda row: row["created_at"], reverse=True))
+
+    def get_by_id(self, string_id: int) -> Optional[Dict]:
+        """根据 ID 获取记录"""
+        return self._locate(string_id)[1]
+
+    def get_by_name(self, name: str) -> Optional[Dict]:
+        """根据名称获取记录"""
+        return self.shards[self._shard_index(name)].get_by_name(name)
+
+    def update(self, string_id: int, name: Optional[str] = None, value: Optional[str] = None,
+               expires_at=UNSET) -> bool:
+        """
+        更新记录
+
+        新名称路由到其他分片时，记录会携带原 ID 迁移过去。
+        """
+        index, row = self._locate(string_id)
+        if row is None:
+            return False
+
+        if name is None or self._shard_index(name) == index:
+            return self.shards[index].update(string_id, name, value, expires_at)
+
+        if name == row["name"]:
+            return self.shards[index].update(string_id, None, value, expires_at)
+
+        moved = self._move(string_id, index, self._shard_index(name), name, value, expires_at)
+        if moved is None:
+            # 记录在定位之后已被其他请求迁移或删除，重新定位
+            return self.update(string_id, name, value, expires_at)
+        return moved
+
+    def _move(self, string_id: int, source: int, target: int, name: str,
+              value: Optional[str], expires_at) -> Optional[bool]:
+        """
+        把记录迁移到目标分片（重命名跨分片时）
+
+        通过 ATTACH 在同一连接、同一事务内完成：写入目标分片、从原分片删除、更新归属分片的
+        位置登记。事务同时持有所涉分片的写锁（按分片编号顺序加锁，避免互相等待），
+        其他连接不会看到同一 ID 的两份记录，并发迁移同一记录时只有一个生效。
+        注意：WAL 模式下多文件事务在进程崩溃时不保证跨文件原子，提交瞬间崩溃仍可能留下重复记录。
+
+        Returns:
+            True 表示迁移成功；None 表示原分片中已无该记录（已被并发迁移或删除）
+        """
+        home = string_id % self.shard_count
+        involved = sorted({source, target, home})
+        schemas = {index: "main" if i == 0 else f"shard{index}" for i, index in enumerate(involved)}
+
+        conn = self._connect(self.shards[involved[0]].db_path)
+        try:
+            for index in involved[1:]:
+                conn.execute(f"ATTACH DATABASE ? AS {schemas[index]}", (self.shards[index].db_path,))
+            conn.execute("BEGIN IMMEDIATE")
+
+            now = StringStorage.now()
+            conn.row_factory = sqlite3.Row
+            row = conn.execute(
+                f"SELECT {COLUMNS} FROM {schemas[source]}.strings WHERE id = ? AND {NOT_EXPIRED}",
+                (string_id, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+
+            record = dict(row, name=name, updated_at=now)
+            if value is not None:
+                record["value"] = value
+            if expires_at is not UNSET:
+                record["expires_at"] = expires_at
+
+            # 同名记录已过期但尚未清理时，直接让出名称
+            conn.execute(
+                f"DELETE FROM {schemas[target]}.strings WHERE name = ? AND expires_at <= ?", (name, now)
+            )
+            conn.execute(f"""
+                INSERT INTO {schemas[target]}.strings
+                    (id, name, value, format, length, created_at, updated_at, value_digest, expires_at)
+                VALUES (:id, :name, :value, :format, :length, :created_at, :updated_at, :value_digest, :expires_at)
+            """, dict(record, value_digest=digest_value(record["value"])))
+            conn.execute(f"DELETE FROM {schemas[source]}.strings WHERE id = ?", (string_id,))
+
+            if target == home:
+                conn.execute(f"DELETE FROM {schemas[home]}.id_locations WHERE id = ?", (string_id,))
+            else:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {schemas[home]}.id_locations (id, shard) VALUES (?, ?)",
+                    (string_id, target)
+                )
+            conn.execute("COMMIT")
+            return True
+        except sqlite3.IntegrityError:
+            conn.execute("ROLLBACK")
+            raise ValueError(f"名称 '{name}' 已存在")
+        finally:
+            conn.close()
+
+    def delete(self, string_id: int) -> bool:
+        """删除记录"""
+        index, row = self._locate(string_id)
+        if row is None:
+            return False
+        deleted = self.shards[index].delete(string_id)
+        if deleted and index != string_id % self.shard_count:
+            self._record_location(string_id, string_id % self.shard_count)
+        return deleted
+
+    def find_digests(self, digests: Iterable[str]) -> Dict[str, Optional[str]]:
+        """通过摘要索引批量查找已保存且未过期的值（值不参与路由，需扫描所有分片）"""
+        digests = list(dict.fromkeys(digests))
+        found = {}
+        for shard_found in self._scatter(lambda shard: shard.find_digests(digests)):
+            for digest, expires_at in shard_found.items():
+                if digest in found:
+                    expires_at = latest_expiry(found[digest], expires_at)
+                found[digest] = expires_at
+        return found
+
+    def iter_values(self, format_type: str, batch_size: int = 1000) -> Iterator[Tuple[str, Optional[int]]]:
+        """依次遍历各分片中某种格式的所有值"""
+        for shard in self.shards:
+            yield from shard.iter_values(format_type, batch_size)
+
+    def value_exists(self, value: str) -> bool:
+        """判断某个值是否已保存"""
+        return bool(self.find_digests([digest_value(value)]))
+
+    def purge_expired(self, batch_size: int = 500, max_batches: Optional[int] = None) -> int:
+        """各分片并发分批清理过期记录（分片间写锁互不影响）"""
+        return sum(self._scatter(lambda shard: shard.purge_expired(batch_size, max_batches)))
+
+    def export_json(self) -> str:
+        """导出所有记录为 JSON 格式"""
+        return json.dumps(self.get_all(), ensure_ascii=False, indent=2)
+
+    def get_statistics(self) -> Dict:
+        """获取统计信息（汇总所有分片）"""
+        total = 0
+        by_format = {}
+        for stats in self._scatter(lambda shard: shard.get_statistics()):
+            total += stats["total"]
+            for format_type, count in stats["by_format"].items():
+                by_format[format_type] = by_format.get(format_type, 0) + count
+
+        return {
+            "total": total,
+            "by_format": by_format
+        }
+
+    def close(self):
+        """关闭并发扫描使用的线程池"""
+        self._executor.shutdown(wait=True)
+
+
+def _open_readonly(db_path: str):
+    """以只读方式打开源数据库，不做任何结构迁移"""
+    return sqlite3.connect(Path(db_path).resolve().as_uri() + "?mode=ro", uri=True)
+
+
+def _check_source_layout(src: str, src_count: int, source_paths: List[str]):
+    """校验源目录的分片文件数量及各分片 shard_meta 与 src_count 一致，避免只迁移部分数据"""
+    existing = len(list(Path(src).glob("strings-*.db")))
+    if existing != src_count:
+        raise ValueError(f"源目录 {src} 中有 {existing} 个分片，与 --src-count {src_count} 不一致")
+
+    for index, source_path in enumerate(source_paths):
+        with closing(_open_readonly(source_path)) as conn:
+            try:
+                meta = dict(conn.execute("SELECT key, value FROM shard_meta").fetchall())
+            except sqlite3.OperationalError:
+                raise ValueError(f"源数据库 {source_path} 缺少 shard_meta，不是有效的分片")
+        if meta.get("shard_count") != src_count or meta.get("shard_index") != index:
+            raise ValueError(
+                f"源分片 {source_path} 记录为 {meta.get('shard_count')} 分片布局中的第 "
+                f"{meta.get('shard_index')} 个，与 --src-count {src_count} 不一致"
+            )
+
+
+def _source_rows(conn, batch_size: int):
+    """
+    从源库分批读取未过期的记录
+
+    兼容缺少 value_digest / expires_at 列的旧库：摘要现算，过期时间视为空。
+    """
+    available = {row[1] for row in conn.execute("PRAGMA table_info(strings)")}
+    selected = ["id", "name", "value", "format", "length", "created_at", "updated_at"]
+    selected += [column for column in ("value_digest", "expires_at") if column in available]
+
+    if "expires_at" in available:
+        # 已过期的记录不再迁移
+        cursor = conn.execute(
+            f"SELECT {', '.join(selected)} FROM strings WHERE {NOT_EXPIRED} ORDER BY id",
+            (StringStorage.now(),)
+        )
+    else:
+        cursor = conn.execute(f"SELECT {', '.join(selected)} FROM strings ORDER BY id")
+
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            record = dict(zip(selected, row))
+            if not record.get("value_digest"):
+                record["value_digest"] = digest_value(record["value"])
+            record.setdefault("expires_at", None)
+            yield record
+
+
+def reshard(src: str, src_count: int, dst_dir: str, dst_count: int, batch_size: int = 1000) -> int:
+    """
+    重新分片：把源数据按新分片数写入 dst_dir
+
+    Args:
+        src: 源分片目录；src_count 为 0 时为单库文件路径（如 data/strings.db）
+        src_count: 源分片数量，0 表示从单个 StringStorage 数据库迁移
+        dst_dir: 目标分片目录（必须为空目录或不存在）
+        dst_count: 目标分片数量
+        batch_size: 每批读取的记录数
+
+    记录 ID 保持不变，新分片的 ID 序列从现有最大 ID 之后开始；不在归属分片的记录
+    登记到 id_locations，按 ID 查询无需扫描。已过期的记录会被跳过。
+    源数据以只读方式打开，不会被修改。新分片先写入 dst_dir.partial 临时目录，
+    全部成功后再改名为 dst_dir，失败时删除临时目录。
+
+    Returns:
+        迁移的记录数
+    """
+    dst_path = Path(dst_dir)
+    staging = dst_path.with_name(dst_path.name + ".partial")
+
+    if Path(src).resolve() == dst_path.resolve():
+        raise ValueError("目标目录不能与源目录相同")
+    if dst_path.exists() and (not dst_path.is_dir() or any(dst_path.iterdir())):
+        raise ValueError(f"目标目录必须为空或不存在: {dst_dir}")
+    if staging.exists():
+        raise ValueError(f"临时目录已存在（可能是上次迁移中断遗留），请确认后手动删除: {staging}")
+
+    if src_count == 0:
+        source_paths = [src]
+    else:
+        source_paths = [ShardedStringStorage._shard_path(src, index) for index in range(src_count)]
+    for source_path in source_paths:
+        if not Path(source_path).is_file():
+            raise ValueError(f"源数据库不存在: {source_path}")
+    if src_count:
+        _check_source_layout(src, src_count, source_paths)
+
+    target = ShardedStringStorage(str(staging), dst_count)
+    columns = ["id", "name", "value", "format", "length", "created_at", "updated_at", "value_digest", "expires_at"]
+    insert_sql = f"INSERT INTO strings ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+    try:
+        moved = 0
+        max_id = -1
+
+        for source_path in source_paths:
+            with closing(_open_readonly(source_path)) as src_conn:
+                buckets = {}
+                locations = {}
+                for record in _source_rows(src_conn, batch_size):
+                    index = target._shard_index(record["name"])
+                    buckets.setdefault(index, []).append(tuple(record[column] for column in columns))
+                    home = record["id"] % dst_count
+                    if index != home:
+                        locations.setdefault(home, []).append((record["id"], index))
+                    max_id = max(max_id, record["id"])
+                    moved += 1
+
+                    if moved % batch_size == 0:
+                        _flush_buckets(target, buckets, locations, insert_sql)
+
+                _flush_buckets(target, buckets, locations, insert_sql)
+
+        # 新序列须跳过所有已用 ID，避免与迁移过来的记录冲突
+        next_seq = max_id // dst_count + 1
+        for shard in target.shards:
+            with closing(sqlite3.connect(shard.db_path)) as conn, conn:
+                conn.execute("UPDATE shard_meta SET value = MAX(value, ?) WHERE key = 'next_seq'", (next_seq,))
+    except BaseException:
+        target.close()
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    target.close()
+    if dst_path.exists():
+        dst_path.rmdir()
+    staging.rename(dst_path)
+    return moved
+
+
+def _flush_buckets(target: ShardedStringStorage, buckets: Dict[int, list],
+                   locations: Dict[int, list], insert_sql: str):
+    """把按分片分组的记录及 ID 位置登记写入目标分片并清空分组"""
+    for index, bucket in buckets.items():
+        try:
+            with closing(sqlite3.connect(target.shards[index].db_path)) as conn, conn:
+                conn.executemany(insert_sql, bucket)
+        except sqlite3.IntegrityError:
+            raise ValueError(f"源数据中存在重复的名称或 ID，无法写入分片 {index}")
+
+    for home, entries in locations.items():
+        with closing(sqlite3.connect(target.shards[home].db_path)) as conn, conn:
+            conn.executemany("INSERT INTO id_locations (id, shard) VALUES (?, ?)", entries)
+
+    buckets.clear()
+    locations.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="字符串存储重新分片工具")
+    parser.add_argument("--src", required=True, help="源分片目录，或单库文件路径（配合 --src-count 0）")
+    parser.add_argument("--src-count", type=int, required=True, help="源分片数量，0 表示单个 strings.db")
+    parser.add_argument("--dst", required=True, help="目标分片目录")
+    parser.add_argument("--dst-count", type=int, required=True, help="目标分片数量")
+    args = parser.parse_args()
+
+    total = reshard(args.src, args.src_count, args.dst, args.dst_count)
+    print(f"迁移完成: {total} 条记录 -> {args.dst} ({args.dst_count} 分片)")
@@ -5,9 +5,40 @@
 
 import sqlite3
 import json
+import hashlib
+import logging
+import threading
+from contextlib import closing
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterable, Iterator, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# 对外返回的字段（不含内部使用的 value_digest）
+COLUMNS = "id, name, value, format, length, created_at, updated_at, expires_at"
+
+# 未过期条件：过期但尚未清理的记录对所有读取立即不可见
+NOT_EXPIRED = "(expires_at IS NULL OR expires_at > ?)"
+
+# 单条 SQL 中 IN 查询的最大参数个数
+_DIGEST_CHUNK = 500
+
+# update() 中表示"未提供"的占位值（expires_at 传 None 表示清除过期时间）
+UNSET = object()
+
+
+def digest_value(value: str) -> str:
+    """计算字符串值的 SHA-256 摘要（十六进制），用于索引查找"""
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def latest_expiry(a: Optional[str], b: Optional[str]) -> Optional[str]:
+    """取两个过期时间中较晚的一个（None 表示永不过期）"""
+    if a is None or b is None:
+        return None
+    return max(a, b)
 
 
 class StringStorage:
@@ -26,6 +57,8 @@ class StringStorage:
     def _init_database(self):
         """初始化数据库表结构"""
         with sqlite3.connect(self.db_path) as conn:
+            # 新库启用增量 vacuum，清理过期记录后可逐步回收页面
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS strings (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -34,12 +67,71 @@ class StringStorage:
                     format TEXT NOT NULL,
                     length INTEGER,
                     created_at TEXT NOT NULL,
-                    updated_at TEXT NOT NULL
+                    updated_at TEXT NOT NULL,
+                    value_digest TEXT,
+                    expires_at TEXT
                 )
             """)
+            self._migrate_value_digest(conn)
+            self._migrate_expires_at(conn)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_strings_value_digest ON strings (value_digest)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_strings_expires_at ON strings (expires_at)")
             conn.commit()
 
-    def save(self, name: str, value: str, format_type: str, length: Optional[int] = None) -> Dict:
+            auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+
+        if auto_vacuum != 2:
+            # 切换需要一次独占数据库的完整 VACUUM，不在启动时（多个工作进程同时）执行
+            logger.warning(
+                "数据库 %s 未启用增量 vacuum，清理过期记录后不会回收空间；"
+                "请停止服务后执行: python storage.py --enable-incremental-vacuum %s",
+                self.db_path, self.db_path
+            )
+
+    def enable_incremental_vacuum(self) -> bool:
+        """
+        把旧数据库切换为增量 vacuum 模式
+
+        需要执行一次完整 VACUUM，期间独占数据库，应在停止服务后通过命令行执行。
+
+        Returns:
+            是否执行了切换（已是增量模式时不做任何操作）
+        """
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                return False
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        finally:
+            conn.close()
+
+    def _migrate_value_digest(self, conn):
+        """为旧数据库补充 value_digest 列并回填摘要"""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(strings)")}
+        if "value_digest" not in columns:
+            conn.execute("ALTER TABLE strings ADD COLUMN value_digest TEXT")
+
+        rows = conn.execute("SELECT id, value FROM strings WHERE value_digest IS NULL").fetchall()
+        conn.executemany(
+            "UPDATE strings SET value_digest = ? WHERE id = ?",
+            [(digest_value(value), string_id) for string_id, value in rows]
+        )
+
+    def _migrate_expires_at(self, conn):
+        """为旧数据库补充 expires_at 列"""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(strings)")}
+        if "expires_at" not in columns:
+            conn.execute("ALTER TABLE strings ADD COLUMN expires_at TEXT")
+
+    @staticmethod
+    def now() -> str:
+        """当前时间（与 created_at 相同的 ISO 格式）"""
+        return datetime.now().isoformat()
+
+    def save(self, name: str, value: str, format_type: str, length: Optional[int] = None,
+             expires_at: Optional[str] = None) -> Dict:
         """
         保存字符串
 
@@ -48,6 +140,7 @@ class StringStorage:
             value: 字符串值
             format_type: 格式类型
             length: 长度（可选）
+            expires_at: 过期时间（ISO 格式，可选）
 
         Returns:
             保存的记录
@@ -55,14 +148,16 @@ class StringStorage:
         Raises:
             ValueError: 名称已存在
         """
-        now = datetime.now().isoformat()
+        now = self.now()
 
         try:
             with sqlite3.connect(self.db_path) as conn:
+                # 同名记录已过期但尚未清理时，直接让出名称
+                conn.execute("DELETE FROM strings WHERE name = ? AND expires_at <= ?", (name, now))
                 cursor = conn.execute("""
-                    INSERT INTO strings (name, value, format, length, created_at, updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (name, value, format_type, length, now, now))
+                    INSERT INTO strings (name, value, format, length, created_at, updated_at, value_digest, expires_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (name, value, format_type, length, now, now, digest_value(value), expires_at))
                 conn.commit()
 
                 return {
@@ -72,14 +167,15 @@ class StringStorage:
                     "format": format_type,
                     "length": length,
                     "created_at": now,
-                    "updated_at": now
+                    "updated_at": now,
+                    "expires_at": expires_at
                 }
         except sqlite3.IntegrityError:
             raise ValueError(f"名称 '{name}' 已存在")
 
     def get_all(self, search: Optional[str] = None) -> List[Dict]:
         """
-        获取所有字符串记录
+        获取所有未过期的字符串记录
 
         Args:
             search: 搜索关键词（可选，搜索名称和值）
@@ -91,16 +187,17 @@ class StringStorage:
             conn.row_factory = sqlite3.Row
 
             if search:
-                cursor = conn.execute("""
-                    SELECT * FROM strings
-                    WHERE name LIKE ? OR value LIKE ?
+                cursor = conn.execute(f"""
+                    SELECT {COLUMNS} FROM strings
+                    WHERE (name LIKE ? OR value LIKE ?) AND {NOT_EXPIRED}
                     ORDER BY created_at DESC
-                """, (f"%{search}%", f"%{search}%"))
+                """, (f"%{search}%", f"%{search}%", self.now()))
             else:
-                cursor = conn.execute("""
-                    SELECT * FROM strings
+                cursor = conn.execute(f"""
+                    SELECT {COLUMNS} FROM strings
+                    WHERE {NOT_EXPIRED}
                     ORDER BY created_at DESC
-                """)
+                """, (self.now(),))
 
             return [dict(row) for row in cursor.fetchall()]
 
@@ -108,7 +205,10 @@ class StringStorage:
         """根据 ID 获取记录"""
         with sqlite3.connect(self.db_path) as conn:
             conn.row_factory = sqlite3.Row
-            cursor = conn.execute("SELECT * FROM strings WHERE id = ?", (string_id,))
+            cursor = conn.execute(
+                f"SELECT {COLUMNS} FROM strings WHERE id = ? AND {NOT_EXPIRED}",
+                (string_id, self.now())
+            )
             row = cursor.fetchone()
             return dict(row) if row else None
 
@@ -116,18 +216,23 @@ class StringStorage:
         """根据名称获取记录"""
         with sqlite3.connect(self.db_path) as conn:
             conn.row_factory = sqlite3.Row
-            cursor = conn.execute("SELECT * FROM strings WHERE name = ?", (name,))
+            cursor = conn.execute(
+                f"SELECT {COLUMNS} FROM strings WHERE name = ? AND {NOT_EXPIRED}",
+                (name, self.now())
+            )
             row = cursor.fetchone()
             return dict(row) if row else None
 
-    def update(self, string_id: int, name: Optional[str] = None, value: Optional[str] = None) -> bool:
+    def update(self, string_id: int, name: Optional[str] = None, value: Optional[str] = None,
+               expires_at=UNSET) -> bool:
         """
-        更新记录
+        更新记录（已过期的记录视为不存在）
 
         Args:
             string_id: 记录 ID
             name: 新名称（可选）
             value: 新值（可选）
+            expires_at: 新过期时间（可选，None 表示永不过期）
 
         Returns:
             是否更新成功
@@ -142,18 +247,32 @@ class StringStorage:
         if value is not None:
             updates.append("value = ?")
             params.append(value)
+            updates.append("value_digest = ?")
+            params.append(digest_value(value))
+
+        if expires_at is not UNSET:
+            updates.append("expires_at = ?")
+            params.append(expires_at)
 
         if not updates:
             return False
 
+        now = self.now()
         updates.append("updated_at = ?")
-        params.append(datetime.now().isoformat())
+        params.append(now)
         params.append(string_id)
+        params.append(now)
 
         try:
             with sqlite3.connect(self.db_path) as conn:
+                if name is not None:
+                    # 同名记录已过期但尚未清理时，直接让出名称
+                    conn.execute(
+                        "DELETE FROM strings WHERE name = ? AND id != ? AND expires_at <= ?",
+                        (name, string_id, now)
+                    )
                 cursor = conn.execute(
-                    f"UPDATE strings SET {', '.join(updates)} WHERE id = ?",
+                    f"UPDATE strings SET {', '.join(updates)} WHERE id = ? AND {NOT_EXPIRED}",
                     params
                 )
                 conn.commit()
@@ -163,7 +282,7 @@ class StringStorage:
 
     def delete(self, string_id: int) -> bool:
         """
-        删除记录
+        删除记录（已过期的记录视为不存在）
 
         Args:
             string_id: 记录 ID
@@ -172,26 +291,121 @@ class StringStorage:
             是否删除成功
         """
         with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("DELETE FROM strings WHERE id = ?", (string_id,))
+            cursor = conn.execute(
+                f"DELETE FROM strings WHERE id = ? AND {NOT_EXPIRED}",
+                (string_id, self.now())
+            )
             conn.commit()
             return cursor.rowcount > 0
 
+    def find_digests(self, digests: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        通过摘要索引批量查找已保存且未过期的值
+
+        Args:
+            digests: 值的 SHA-256 摘要（见 digest_value）
+
+        Returns:
+            存在于数据库中的摘要 -> 最晚过期时间（None 表示永不过期）
+        """
+        digests = list(dict.fromkeys(digests))
+        found = {}
+        now = self.now()
+
+        with sqlite3.connect(self.db_path) as conn:
+            for start in range(0, len(digests), _DIGEST_CHUNK):
+                chunk = digests[start:start + _DIGEST_CHUNK]
+                placeholders = ", ".join("?" * len(chunk))
+                cursor = conn.execute(
+                    f"SELECT value_digest, expires_at FROM strings "
+                    f"WHERE value_digest IN ({placeholders}) AND {NOT_EXPIRED}",
+                    chunk + [now]
+                )
+                for digest, expires_at in cursor.fetchall():
+                    if digest in found:
+                        expires_at = latest_expiry(found[digest], expires_at)
+                    found[digest] = expires_at
+
+        return found
+
+    def iter_values(self, format_type: str, batch_size: int = 1000) -> Iterator[Tuple[str, Optional[int]]]:
+        """
+        分批遍历某种格式的所有值（含已过期但未清理的记录）
+
+        Args:
+            format_type: 格式类型
+            batch_size: 每批读取的记录数
+
+        Yields:
+            (值, 长度)
+        """
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            cursor = conn.execute("SELECT value, length FROM strings WHERE format = ?", (format_type,))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+
+    def value_exists(self, value: str) -> bool:
+        """判断某个值是否已保存"""
+        return bool(self.find_digests([digest_value(value)]))
+
     def export_json(self) -> str:
         """导出所有记录为 JSON 格式"""
         records = self.get_all()
         return json.dumps(records, ensure_ascii=False, indent=2)
 
+    def purge_expired(self, batch_size: int = 500, max_batches: Optional[int] = None) -> int:
+        """
+        分批删除已过期的记录并增量回收空闲页面
+
+        每批在独立的短事务中完成，避免长时间占用写锁。
+
+        Args:
+            batch_size: 每批删除的最大记录数
+            max_batches: 最多执行的批数（可选，默认删完为止）
+
+        Returns:
+            删除的记录数
+        """
+        purged = 0
+        batches = 0
+
+        while max_batches is None or batches < max_batches:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.execute("""
+                    DELETE FROM strings WHERE id IN (
+                        SELECT id FROM strings WHERE expires_at <= ? LIMIT ?
+                    )
+                """, (self.now(), batch_size))
+                deleted = cursor.rowcount
+                conn.commit()
+
+                if deleted:
+                    # 每批最多回收 batch_size 个空闲页，同样保持短暂持锁
+                    conn.execute(f"PRAGMA incremental_vacuum({int(batch_size)})").fetchall()
+
+            purged += deleted
+            batches += 1
+            if deleted < batch_size:
+                break
+
+        return purged
+
     def get_statistics(self) -> Dict:
-        """获取统计信息"""
+        """获取统计信息（不含已过期的记录）"""
         with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("SELECT COUNT(*) as total FROM strings")
+            now = self.now()
+            cursor = conn.execute(f"SELECT COUNT(*) as total FROM strings WHERE {NOT_EXPIRED}", (now,))
             total = cursor.fetchone()[0]
 
-            cursor = conn.execute("""
+            cursor = conn.execute(f"""
                 SELECT format, COUNT(*) as count
                 FROM strings
+                WHERE {NOT_EXPIRED}
                 GROUP BY format
-            """)
+            """, (now,))
             by_format = {row[0]: row[1] for row in cursor.fetchall()}
 
             return {
@@ -200,7 +414,59 @@ class StringStorage:
             }
 
 
+class ExpiryPurger:
+    """
+    过期记录后台清理线程
+
+    定期调用 storage.purge_expired()，每批之间让出写锁。
+    """
+
+    def __init__(self, storage, interval: float = 60, batch_size: int = 500):
+        """
+        Args:
+            storage: StringStorage 或 ShardedStringStorage
+            interval: 清理间隔（秒）
+            batch_size: 每批删除的最大记录数
+        """
+        self.storage = storage
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="expiry-purger", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.storage.purge_expired(self.batch_size)
+            except sqlite3.Error:
+                # 数据库繁忙等错误留到下一轮重试
+                logger.warning("清理过期记录失败", exc_info=True)
+
+
 if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="字符串存储（不带参数时运行测试代码）")
+    parser.add_argument("--enable-incremental-vacuum", nargs="+", metavar="DB",
+                        help="把旧数据库（如 data/strings.db 或各分片文件）切换为增量 vacuum，需先停止服务")
+    args = parser.parse_args()
+
+    if args.enable_incremental_vacuum:
+        for db_path in args.enable_incremental_vacuum:
+            if not Path(db_path).is_file():
+                sys.exit(f"数据库不存在: {db_path}")
+            converted = StringStorage(db_path).enable_incremental_vacuum()
+            print(f"{db_path}: {'已切换为增量 vacuum' if converted else '已是增量 vacuum，无需切换'}")
+        sys.exit(0)
+
     # 测试代码
     storage = StringStorage("data/test.db")
 
@@ -0,0 +1,292 @@
+"""
+唯一性保护模块
+使用持久化、内存映射的布隆过滤器记录已生成的值，多个工作进程共享同一份文件
+"""
+
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from generator import StringGenerator
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 下没有 fcntl，仅做进程内加锁
+    fcntl = None
+
+
+class BloomFilter:
+    """
+    基于内存映射文件的布隆过滤器
+
+    文件结构: 头部（魔数、位数、哈希函数个数）+ 按长度分桶的添加计数 + 位数组。
+    位数组以稀疏文件方式创建，未写入的页不占用磁盘。
+    写入时持有文件锁，多个进程映射同一文件即可共享过滤器。
+    魔数在初始填充完成后才写入，填充中断的文件会在下次打开时重建。
+    """
+
+    MAGIC = b"ISBF"
+    HEADER = struct.Struct("<4sQI")
+    # 计数桶：0 为不区分长度，1-255 为对应长度，256 为长度 >= 256
+    BUCKETS = 257
+    COUNTS = struct.Struct(f"<{BUCKETS}Q")
+
+    def __init__(self, path, capacity=1_000_000, error_rate=0.001,
+                 populate: Optional[Callable[[Callable[[str, int], bool]], None]] = None):
+        """
+        Args:
+            path: 过滤器文件路径，不存在时按 capacity / error_rate 创建
+            capacity: 预期容纳的元素数量
+            error_rate: 预期误判率
+            populate: 新建时的初始填充回调，参数为 add(value, bucket)；
+                      在文件锁内执行，其他进程会等待填充完成
+
+        已存在的文件沿用文件中记录的参数。
+        """
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError("容量必须大于 0，误判率必须在 0-1 之间")
+
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._offset = self.HEADER.size + self.COUNTS.size
+
+        num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        self._file = os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644), "r+b")
+        self._file_lock()
+        try:
+            self._file.seek(0)
+            magic = self._file.read(len(self.MAGIC))
+            if magic in (b"", b"\0" * len(self.MAGIC)):
+                # 新文件或上次填充中断：清空后重建，魔数暂时置零
+                self._file.seek(0)
+                self._file.truncate(0)
+                self._file.write(self.HEADER.pack(b"\0" * len(self.MAGIC), num_bits, num_hashes))
+                self._file.truncate(self._offset + (num_bits + 7) // 8)
+                self._file.flush()
+                self._open_mmap()
+                if populate is not None:
+                    populate(self._add_locked)
+                self._mmap[:len(self.MAGIC)] = self.MAGIC
+                self._mmap.flush()
+            else:
+                self._open_mmap()
+        finally:
+            self._file_unlock()
+
+        if self._mmap[:len(self.MAGIC)] != self.MAGIC:
+            raise ValueError(f"不是有效的过滤器文件: {self.path}")
+
+    def _open_mmap(self):
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+        _, self.num_bits, self.num_hashes = self.HEADER.unpack_from(self._mmap, 0)
+
+    def _file_lock(self):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+
+    def _file_unlock(self):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def _positions(self, value: str):
+        """双重哈希计算位下标"""
+        digest = hashlib.sha256(value.encode("utf-8")).digest()
+        h1, h2 = struct.unpack_from("<QQ", digest)
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def _test(self, positions) -> bool:
+        return all(self._mmap[self._offset + pos // 8] & (1 << (pos % 8)) for pos in positions)
+
+    def __contains__(self, value: str) -> bool:
+        return self._test(self._positions(value))
+
+    def add(self, value: str, bucket: int = 0) -> bool:
+        """
+        添加元素
+
+        Args:
+            value: 元素
+            bucket: 计数桶（见 BUCKETS）
+
+        Returns:
+            添加前是否已（可能）存在；已存在时不重复计数
+        """
+        with self._lock:
+            self._file_lock()
+            try:
+                return self._add_locked(value, bucket)
+            finally:
+                self._file_unlock()
+
+    def _add_locked(self, value: str, bucket: int = 0) -> bool:
+        """添加元素（调用方需持有文件锁）"""
+        positions = self._positions(value)
+        present = self._test(positions)
+        if not present:
+            for pos in positions:
+                self._mmap[self._offset + pos // 8] |= 1 << (pos % 8)
+            slot = self.HEADER.size + 8 * min(max(int(bucket), 0), self.BUCKETS - 1)
+            struct.pack_into("<Q", self._mmap, slot, struct.unpack_from("<Q", self._mmap, slot)[0] + 1)
+        return present
+
+    def bucket_counts(self) -> Dict[int, int]:
+        """各计数桶的元素数量（仅非零桶）"""
+        counts = self.COUNTS.unpack_from(self._mmap, self.HEADER.size)
+        return {bucket: count for bucket, count in enumerate(counts) if count}
+
+    @property
+    def count(self) -> int:
+        """已添加的元素数量"""
+        return sum(self.COUNTS.unpack_from(self._mmap, self.HEADER.size))
+
+    @property
+    def size_bytes(self) -> int:
+        """实际占用的磁盘空间（稀疏文件未写入的页不计）"""
+        stat = os.fstat(self._file.fileno())
+        return getattr(stat, "st_blocks", stat.st_size // 512) * 512
+
+    def false_positive_rate(self) -> float:
+        """按当前元素数量估算的误判率"""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+class UniquenessGuard:
+    """
+    生成值唯一性保护
+
+    每种格式对应一个布隆过滤器文件（最多与支持的格式数相同），按长度分桶计数。
+    过滤器新建时通过 source 回调载入存储中已有的值，之后保存或修改的值通过 add() 记录，
+    因此过滤器未命中时值必然未出现过；命中时才通过 exists 回调到存储中精确确认，排除误判。
+    注意：只生成未保存的值不在存储中，过滤器命中后无法精确确认，会按误判放行。
+    """
+
+    def __init__(self, directory="data/bloom", capacity=1_000_000, error_rate=0.001,
+                 exists: Optional[Callable[[str], bool]] = None,
+                 source: Optional[Callable[[str], Iterable[Tuple[str, Optional[int]]]]] = None):
+        """
+        Args:
+            directory: 过滤器文件目录
+            capacity: 每个过滤器的预期容量
+            error_rate: 每个过滤器的预期误判率
+            exists: 精确确认回调（如 storage.value_exists）
+            source: 按格式列出已保存的 (值, 长度) 的回调（如 storage.iter_values），
+                    用于新建过滤器时的初始填充
+        """
+        self.directory = Path(directory)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.exists = exists
+        self.source = source
+        self._filters: Dict[str, BloomFilter] = {}
+        self._lock = threading.Lock()
+
+    def _filter_path(self, format_type: str) -> Path:
+        return self.directory / f"{format_type}.bloom"
+
+    @staticmethod
+    def _bucket(length) -> int:
+        """长度对应的计数桶；None、布尔值及其他无法解析为整数的长度归入 0"""
+        if isinstance(length, bool):
+            return 0
+        if isinstance(length, int):
+            return length
+        if isinstance(length, str):
+            try:
+                return int(length)
+            except ValueError:
+                return 0
+        return 0
+
+    def _get_filter(self, format_type: str) -> BloomFilter:
+        """按需打开（或创建）格式对应的过滤器"""
+        if format_type not in StringGenerator.get_supported_formats():
+            raise ValueError(f"不支持的格式类型: {format_type}")
+
+        with self._lock:
+            if format_type not in self._filters:
+                populate = None
+                if self.source is not None:
+                    def populate(add):
+                        for value, length in self.source(format_type):
+                            add(value, self._bucket(length))
+
+                self._filters[format_type] = BloomFilter(
+                    self._filter_path(format_type), self.capacity, self.error_rate, populate
+                )
+            return self._filters[format_type]
+
+    def add(self, format_type: str, length: Optional[int], value: str):
+        """记录通过其他途径（手动保存、修改）进入存储的值"""
+        self._get_filter(format_type).add(value, self._bucket(length))
+
+    def check_and_add(self, format_type: str, length: Optional[int], value: str) -> bool:
+        """
+        检查值是否唯一并记录
+
+        Args:
+            format_type: 格式类型
+            length: 长度（不支持长度的格式为 None）
+            value: 生成的值
+
+        Returns:
+            True 表示可以使用，False 表示确认重复需要重新生成
+        """
+        bloom = self._get_filter(format_type)
+        if value in bloom and self.exists is not None and self.exists(value):
+            return False
+        bloom.add(value, self._bucket(length))
+        return True
+
+    def report(self) -> List[Dict]:
+        """
+        各格式/长度的过滤器统计与碰撞概率估算
+
+        filter_* 为该格式共用的过滤器信息；collision_probability 为按该长度
+        已记录数量和格式熵估算的生日碰撞概率。
+
+        长度按记录时声明的 length 分桶：生成的值与实际长度一致，手动保存的值按请求中的
+        length 计入（未提供时计入 length 为 null 的桶），其实际随机长度可能更短，
+        此时报告会低估碰撞概率。
+        """
+        result = []
+        for format_type in sorted(StringGenerator.get_supported_formats()):
+            # 只统计已存在的过滤器，不为报告新建文件
+            if format_type not in self._filters and not self._filter_path(format_type).exists():
+                continue
+            bloom = self._get_filter(format_type)
+
+            for bucket, issued in sorted(bloom.bucket_counts().items()):
+                length = bucket or None
+                bits = StringGenerator.entropy_bits(format_type, length or 32)
+                if issued < 2:
+                    collision = 0.0
+                else:
+                    pairs = issued * (issued - 1) / 2
+                    collision = -math.expm1(-math.exp(math.log(pairs) - bits * math.log(2)))
+                result.append({
+                    "format": format_type,
+                    "length": length,
+                    "issued": issued,
+                    "filter_bytes": bloom.size_bytes,
+                    "filter_hashes": bloom.num_hashes,
+                    "false_positive_rate": bloom.false_positive_rate(),
+                    "entropy_bits": round(bits, 2),
+                    "collision_probability": collision
+                })
+        return result
+
+    def close(self):
+        for bloom in self._filters.values():
+            bloom.close()
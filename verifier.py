@@ -0,0 +1,101 @@
+"""
+令牌校验模块
+通过值的 SHA-256 摘要索引判断令牌是否为已保存的值
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import List
+
+from storage import StringStorage, digest_value
+
+
+class TokenVerifier:
+    """
+    令牌校验器
+
+    只按摘要精确匹配，不做模糊搜索，也不返回相近的记录。
+    可选的热数据缓存保存最近校验成功的摘要及其过期时间（LRU），命中时无需访问数据库；
+    未命中的结果不缓存，保证新保存的值立即可校验通过。
+
+    缓存只在本进程内失效，其他进程修改或删除的值最多在 cache_ttl 秒内仍被视为有效。
+    """
+
+    def __init__(self, storage, cache_size: int = 0, cache_ttl: float = 5):
+        """
+        Args:
+            storage: StringStorage 或 ShardedStringStorage
+            cache_size: 热数据缓存容量，0 表示不启用
+            cache_ttl: 缓存项的最长存活时间（秒），限制多进程部署下的过期窗口
+        """
+        self.storage = storage
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # 每次失效递增；查询期间发生过失效时不回填缓存，避免缓存已删除的值
+        self._generation = 0
+
+    def verify(self, value: str) -> bool:
+        """校验单个令牌"""
+        return self.verify_many([value])[0]
+
+    def verify_many(self, values: List[str]) -> List[bool]:
+        """
+        批量校验令牌
+
+        Args:
+            values: 待校验的令牌列表
+
+        Returns:
+            与输入顺序一致的校验结果
+        """
+        digests = [digest_value(value) for value in values]
+        found = set()
+        generation = self._generation
+
+        if self.cache_size:
+            now = StringStorage.now()
+            tick = time.monotonic()
+            with self._lock:
+                generation = self._generation
+                for digest in digests:
+                    if digest not in self._cache:
+                        continue
+                    expires_at, cached_until = self._cache[digest]
+                    if cached_until <= tick or (expires_at is not None and expires_at <= now):
+                        del self._cache[digest]
+                        continue
+                    self._cache.move_to_end(digest)
+                    found.add(digest)
+
+        missing = [digest for digest in digests if digest not in found]
+        if missing:
+            hits = self.storage.find_digests(missing)
+            found.update(hits)
+            self._remember(hits, generation)
+
+        return [digest in found for digest in digests]
+
+    def invalidate(self, value: str):
+        """值被修改、删除或调整过期时间后移出缓存"""
+        if self.cache_size:
+            with self._lock:
+                self._cache.pop(digest_value(value), None)
+                self._generation += 1
+
+    def _remember(self, digests, generation: int):
+        """把校验成功的摘要（摘要 -> 过期时间）加入缓存，超出容量时淘汰最久未使用的项"""
+        if not self.cache_size or not digests:
+            return
+
+        cached_until = time.monotonic() + self.cache_ttl
+        with self._lock:
+            if generation != self._generation:
+                return
+            for digest, expires_at in digests.items():
+                self._cache[digest] = (expires_at, cached_until)
+                self._cache.move_to_end(digest)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)